@@ -54,6 +54,9 @@ class EnharmonicSpelling(Enum):
 class Note:
     note: int
     enharmonicSpelling: EnharmonicSpelling
+    # Not part of the song format, only kept from the MIDI file for
+    # converting
+    velocity: Optional[int] = None
 
 
 @dataclass
@@ -101,6 +104,16 @@ def get16BitNumber(num: Optional[int]) -> bytes:
     return pack("<H", 0 if num is None else num)
 
 
+def getNoteValue(note: Note, instrumentOctave: int) -> int:
+    note_val = (note.note - (instrumentOctave - 2) * 12)
+    note_val += 1 - 12
+    return note_val
+
+
+def isNoteInRange(note: Note, instrumentOctave: int) -> bool:
+    return 0 <= getNoteValue(note, instrumentOctave) <= 63
+
+
 def encodeNote(note: Note, instrumentOctave: int, isDrumTrack: bool) -> bytes:
     if isDrumTrack:
         return bytes([note.note])
@@ -111,8 +124,7 @@ def encodeNote(note: Note, instrumentOctave: int, isDrumTrack: bool) -> bytes:
     elif note.enharmonicSpelling == EnharmonicSpelling.SHARP:
         flags = 2
 
-    note_val = (note.note - (instrumentOctave - 2) * 12)
-    note_val += 1 - 12
+    note_val = getNoteValue(note, instrumentOctave)
     byte_val = note_val | (flags << 6)
 
     if note_val > 63:
@@ -130,11 +142,20 @@ def encodeNote(note: Note, instrumentOctave: int, isDrumTrack: bool) -> bytes:
 
 def encodeNoteEvent(event: NoteEvent, instrumentOctave: int,
                     isDrumTrack: bool) -> bytes:
+    # Notes out of range are left out of the count too, otherwise the count
+    # says there are more notes than were written
+    notes = []
+    for note in event.notes:
+        if isDrumTrack or isNoteInRange(note, instrumentOctave):
+            notes.append(note)
+        else:
+            logger.warning(f"Note {note.note} is out of the track range, "
+                           f"skipping note!")
     out = bytearray()
     out += get16BitNumber(event.startTick)
     out += get16BitNumber(event.endTick)
-    out.append(len(event.notes))
-    for note in event.notes:
+    out.append(len(notes))
+    for note in notes:
         out += encodeNote(note, instrumentOctave, isDrumTrack)
     return out
 
@@ -203,7 +224,10 @@ def encodeSong(song: Song) -> bytes:
             )
         )
     )
+    return encodeSongWithTracks(song, encodedTracks)
+
 
+def encodeSongWithTracks(song: Song, encodedTracks: List[bytes]) -> bytes:
     out = bytearray()
     out.append(0)
     out += get16BitNumber(song.beatsPerMinute)
@@ -0,0 +1,193 @@
+from copy import deepcopy
+from dataclasses import replace
+from math import isqrt
+
+from .music import NoteEvent, Song, Track, encodeSong
+
+
+class TrackIndex:
+    """
+    An interval index over the note events of a track, for finding the events
+    that sound between two ticks in O(log n + k).
+
+    The events are kept sorted by start tick in an implicit interval tree:
+    the event in the middle of every range of the sorted list stores the
+    latest end tick in that range, so whole ranges that end before the query
+    are skipped. Events added or removed with insert and remove are kept on
+    the side and only merged into the tree once there are enough of them, so
+    edits don't rebuild the index every time. Change the track through
+    insert and remove, or call rebuild after changing track.notes directly.
+    """
+
+    def __init__(self, track: Track):
+        """
+        :param track: The Track to index.
+        """
+        self.track = track
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        Builds the index again from the events in the track.
+        """
+        self._events = sorted(self.track.notes, key=lambda e: e.startTick)
+        self._starts = [e.startTick for e in self._events]
+        self._max_ends = [0] * len(self._events)
+        self._build(0, len(self._events))
+        self._inserted: list[NoteEvent] = []
+        self._removed: set[int] = set()
+
+    def _build(self, lo: int, hi: int) -> int:
+        if lo >= hi:
+            return -1
+        mid = (lo + hi) // 2
+        self._max_ends[mid] = max(_sounding_end(self._events[mid]),
+                                  self._build(lo, mid),
+                                  self._build(mid + 1, hi))
+        return self._max_ends[mid]
+
+    def _maybe_rebuild(self):
+        limit = max(32, isqrt(len(self._events)))
+        if len(self._inserted) > limit or len(self._removed) > limit:
+            self.rebuild()
+
+    def query(self, start_tick: int, end_tick: int) -> list[NoteEvent]:
+        """
+        Finds the events that sound between two ticks.
+
+        :param start_tick: The first tick.
+        :param end_tick: The tick after the last tick.
+        :return: A list of NoteEvents that sound in [start_tick, end_tick),
+         sorted by start tick.
+        """
+        found = []
+        self._query(0, len(self._events), start_tick, end_tick, found)
+        if len(self._removed) > 0:
+            found = [e for e in found if id(e) not in self._removed]
+        if len(self._inserted) > 0:
+            found += [e for e in self._inserted
+                      if e.startTick < end_tick and
+                      _sounding_end(e) > start_tick]
+            found.sort(key=lambda e: e.startTick)
+        return found
+
+    def _query(self, lo: int, hi: int, start_tick: int, end_tick: int,
+               found: list[NoteEvent]):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self._max_ends[mid] <= start_tick:
+            return
+        self._query(lo, mid, start_tick, end_tick, found)
+        if self._starts[mid] >= end_tick:
+            return
+        if _sounding_end(self._events[mid]) > start_tick:
+            found.append(self._events[mid])
+        self._query(mid + 1, hi, start_tick, end_tick, found)
+
+    def insert(self, event: NoteEvent):
+        """
+        Adds an event to the track and the index.
+
+        :param event: The NoteEvent to add.
+        """
+        self.track.notes.append(event)
+        self._inserted.append(event)
+        self._maybe_rebuild()
+
+    def remove(self, event: NoteEvent):
+        """
+        Removes an event from the track and the index.
+
+        :param event: The NoteEvent to remove. It must be in the track.
+        """
+        for i, e in enumerate(self.track.notes):
+            if e is event:
+                del self.track.notes[i]
+                break
+        else:
+            raise ValueError(f"Event {event} is not in the track!")
+        for i, e in enumerate(self._inserted):
+            if e is event:
+                del self._inserted[i]
+                return
+        self._removed.add(id(event))
+        self._maybe_rebuild()
+
+
+def _sounding_end(event: NoteEvent) -> int:
+    # Events that start and end on the same tick still sound on that tick
+    return max(event.endTick, event.startTick + 1)
+
+
+class SongIndex:
+    """
+    Interval indexes over every track of a song, for finding and cutting out
+    measures of the song.
+    """
+
+    def __init__(self, song: Song):
+        """
+        :param song: The Song to index.
+        """
+        self.song = song
+        self.tracks = [TrackIndex(track) for track in song.tracks]
+
+    @property
+    def ticks_per_measure(self) -> int:
+        return self.song.ticksPerBeat * self.song.beatsPerMeasure
+
+    def query_measures(self, start_measure: int,
+                       end_measure: int) -> list[list[NoteEvent]]:
+        """
+        Finds the events of every track that sound in a range of measures.
+
+        :param start_measure: The first measure, starting from 0.
+        :param end_measure: The measure after the last measure.
+        :return: A list with a list of NoteEvents for every track.
+        """
+        start_tick = start_measure * self.ticks_per_measure
+        end_tick = end_measure * self.ticks_per_measure
+        return [t.query(start_tick, end_tick) for t in self.tracks]
+
+    def slice(self, start_measure: int, end_measure: int) -> Song:
+        """
+        Cuts a range of measures out into a new song. Events are cut to the
+        range and their ticks are moved so the range starts at tick 0.
+
+        :param start_measure: The first measure, starting from 0.
+        :param end_measure: The measure after the last measure.
+        :return: A new Song with end_measure - start_measure measures.
+        """
+        if not 0 <= start_measure < end_measure:
+            raise ValueError(f"Measure range must be increasing and start at "
+                             f"0 or later, not {start_measure} to "
+                             f"{end_measure}!")
+        start_tick = start_measure * self.ticks_per_measure
+        end_tick = end_measure * self.ticks_per_measure
+        tracks = []
+        for track, events in zip(self.song.tracks,
+                                 self.query_measures(start_measure,
+                                                     end_measure)):
+            notes = [
+                NoteEvent(
+                    notes=list(e.notes),
+                    startTick=max(e.startTick, start_tick) - start_tick,
+                    endTick=min(e.endTick, end_tick) - start_tick
+                )
+                for e in events
+            ]
+            tracks.append(replace(track, notes=notes,
+                                  instrument=deepcopy(track.instrument)))
+        return replace(self.song, measures=end_measure - start_measure,
+                       tracks=tracks)
+
+    def encode_measures(self, start_measure: int, end_measure: int) -> bytes:
+        """
+        Encodes only a range of measures of the song.
+
+        :param start_measure: The first measure, starting from 0.
+        :param end_measure: The measure after the last measure.
+        :return: The encoded song of the range.
+        """
+        return encodeSong(self.slice(start_measure, end_measure))
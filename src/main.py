@@ -1,13 +1,25 @@
 import logging
+import sys
 from argparse import ArgumentParser
+from io import StringIO
 from pathlib import Path
+from time import monotonic, sleep
+from typing import Iterable, Optional, Union
 
 from mido import MidiFile
 
-from arcade.music import encodeSong
+from arcade.music import Song, encodeSong
+from arcade.song_index import SongIndex
 from arcade.tracks import get_available_tracks
 from midi_to_song import midi_to_song
-from utils.logger import create_logger, set_all_stdout_logger_levels
+from midi_watcher import MidiWatcher, find_midi_files
+from polyphony import PRIORITIES, limit_polyphony, log_polyphony_report
+from song_bundle import EncodedSong, SongBundleWriter
+from song_preview import write_preview
+from utils.atomic_file import write_atomically
+from utils.hex_string import bytes_to_hex_literal
+from utils.logger import create_logger, redirect_stdout_logs_to_stderr, \
+    set_all_stdout_logger_levels, start_queue_logging, stop_queue_logging
 
 tracks = get_available_tracks()
 track_names = [t.name.lower() for t in tracks]
@@ -16,11 +28,29 @@ track_ids = [str(t.id) for t in tracks]
 parser = ArgumentParser(prog="ArcadeMIDItoSong",
                         description="A program to convert MIDI files to the "
                                     "Arcade song format. ")
-parser.add_argument("--input", "-i", required=True, type=Path,
-                    help="Input MIDI file")
+parser.add_argument("--input", "-i", required=True, type=Path, nargs="+",
+                    help="Input MIDI file. You can pass more than one file "
+                         "or directories of MIDI files when using --bundle.")
 parser.add_argument("--output", "-o", type=Path,
                     help="Output text file path, otherwise we will output to "
                          "standard output.")
+parser.add_argument("--bundle", metavar="NAMESPACE",
+                    help="Write all the input files as song constants in a "
+                         "TypeScript namespace with this name instead of a "
+                         "single hex string.")
+parser.add_argument("--size-report", action="store_true",
+                    help="With --bundle, also print the size of every song "
+                         "and track.")
+parser.add_argument("--watch", "-w", action="store_true",
+                    help="Keep running and convert the input files again "
+                         "whenever their content changes.")
+parser.add_argument("--interval", type=float, default=0.5,
+                    help="With --watch, how many seconds to wait between "
+                         "checking the input files. Defaults to 0.5.")
+parser.add_argument("--debounce", type=float, default=0.5,
+                    help="With --watch, how many seconds a file must stay "
+                         "unchanged before it is converted again. Defaults "
+                         "to 0.5.")
 parser.add_argument("--track", "-t", metavar="TRACK",
                     choices=track_ids + track_names,
                     default=track_names[0],
@@ -35,10 +65,32 @@ parser.add_argument("--divisor", "-d", type=float,
                          "can fit in the maximum of 255 measures of a song, "
                          "but with less precision. Must be greater than 0, "
                          "defaults to 1 for no division.")
+parser.add_argument("--measures", "-m", type=int, nargs=2,
+                    metavar=("FIRST", "LAST"),
+                    help="Only convert the measures from FIRST to LAST "
+                         "(including LAST), counting from 1.")
+parser.add_argument("--max-polyphony", "-p", type=int, default=0,
+                    help="The most notes that may sound at once in each "
+                         "track. Extra notes are dropped. Defaults to 0 for "
+                         "no limit.")
+parser.add_argument("--polyphony-priority", choices=PRIORITIES,
+                    default=PRIORITIES[0],
+                    help="Which notes to drop first with --max-polyphony: "
+                         "'velocity' drops the quietest, 'shortest' drops "
+                         "the shortest and 'inner' drops notes between the "
+                         "highest and lowest ones. Defaults to "
+                         f"'{PRIORITIES[0]}'.")
+parser.add_argument("--polyphony-report", type=int, metavar="VOICES",
+                    help="Print where each track has more than this many "
+                         "notes sounding at once.")
 parser.add_argument("--break", "-b", type=int, dest="char_break",
                     default=0,
                     help="Break the hex string after so many characters. "
                          "Defaults to 0 for no breaking.")
+parser.add_argument("--preview", type=Path, metavar="PATH",
+                    help="Also render the song to a WAV file at this path to "
+                         "listen to. With --bundle, this is a directory that "
+                         "gets a WAV file for every song.")
 parser.add_argument("--debug", action="store_const",
                     const=logging.DEBUG, default=logging.INFO,
                     help="Include debug messages. Defaults to info and "
@@ -46,13 +98,24 @@ parser.add_argument("--debug", action="store_const",
 args = parser.parse_args()
 logger = create_logger(name=__name__, level=logging.INFO)
 set_all_stdout_logger_levels(args.debug)
+if args.output is None:
+    # Keep the song the only thing on standard output
+    redirect_stdout_logs_to_stderr()
 logger.debug(f"Received arguments: {args}")
 
-input_path = Path(args.input)
-logger.debug(f"Input path is {input_path}")
+input_paths = find_midi_files(Path(p) for p in args.input)
+logger.debug(f"Input paths are {input_paths}")
+if args.bundle is None:
+    if args.watch and (len(args.input) != 1 or args.input[0].is_dir()):
+        # Files can be added to a watched directory later, so it needs a
+        # bundle even if it only has 1 MIDI file right now
+        raise ValueError(f"Can only watch 1 file without --bundle, not "
+                         f"{', '.join(str(p) for p in args.input)}!")
+    if not args.watch and len(input_paths) != 1:
+        raise ValueError(f"Can only convert 1 file without --bundle, "
+                         f"not {len(input_paths)}!")
 
-midi = MidiFile(input_path)
-logger.debug(f"MIDI is {midi.length}s long")
+track_id = int(args.track) if args.track.isnumeric() else args.track
 
 divisor = float(args.divisor)
 if not divisor > 0:
@@ -64,31 +127,184 @@ char_break = int(args.char_break)
 if char_break < 0:
     raise ValueError(f"break must be an integer greater than or equal to 0, "
                      f"not {char_break}!")
+logger.debug(f"Using character break of {char_break}")
 
-song = midi_to_song(midi, int(args.track) if args.track.isnumeric() else args.track,
-                    divisor)
-bin_result = encodeSong(song)
+if args.measures is not None:
+    first_measure, last_measure = args.measures
+    if not 1 <= first_measure <= last_measure:
+        raise ValueError(f"measures must be integers greater than or equal "
+                         f"to 1 with FIRST not after LAST, not "
+                         f"{first_measure} and {last_measure}!")
+    if last_measure - first_measure + 1 > 255:
+        raise ValueError(f"A song can only have up to 255 measures, but "
+                         f"measures {first_measure} to {last_measure} are "
+                         f"{last_measure - first_measure + 1} measures!")
+    logger.debug(f"Only converting measures {first_measure} to "
+                 f"{last_measure}")
 
-logger.debug(f"Generated {len(bin_result)} bytes, converting to text")
+max_polyphony = int(args.max_polyphony)
+if max_polyphony < 0:
+    raise ValueError(f"max polyphony must be an integer greater than or "
+                     f"equal to 0, not {max_polyphony}!")
+logger.debug(f"Using max polyphony of {max_polyphony}")
 
-logger.debug(f"Using character break of {char_break}")
+output_path = args.output
+bundle_writer = None
+if args.bundle is not None:
+    bundle_writer = SongBundleWriter(args.bundle, char_break)
 
-hex_result = map(lambda v: format(v, "02x"), bin_result)
-result = "hex`"
-for i, hex_num in enumerate(hex_result):
-    if char_break != 0 and i % char_break == 0:
-        result += "\n    "
-    result += hex_num
-if char_break != 0:
-    result += "\n"
-result += "`"
 
-logger.debug(f"Hex string result is {len(result)} characters long")
+def convert_midi(path: Path) -> Song:
+    midi = MidiFile(path)
+    logger.debug(f"MIDI {path} is {midi.length}s long")
+    return process_song(path, midi_to_song(midi, track_id, divisor))
 
-output_path = args.output
-if output_path is None:
-    logger.debug("No output path provided, printing to standard output")
-    print(result)
+
+def process_song(path: Path, song: Song) -> Song:
+    if args.measures is not None:
+        if first_measure > song.measures:
+            raise ValueError(f"{path} only has {song.measures} measures, so "
+                             f"it can't start at measure {first_measure}!")
+        song_last_measure = last_measure
+        if last_measure > song.measures:
+            logger.warning(f"{path} only has {song.measures} measures, only "
+                           f"converting measures {first_measure} to "
+                           f"{song.measures}")
+            song_last_measure = song.measures
+        song = SongIndex(song).slice(first_measure - 1, song_last_measure)
+    if max_polyphony > 0:
+        for i, track in enumerate(song.tracks):
+            dropped = limit_polyphony(track, max_polyphony,
+                                      args.polyphony_priority)
+            logger.debug(f"Dropped {dropped} notes from track {i} to stay "
+                         f"within {max_polyphony} voices")
+    if args.polyphony_report is not None:
+        log_polyphony_report(song, args.polyphony_report)
+    if args.preview is not None and song.beatsPerMinute < 1:
+        logger.warning(f"Not writing a preview of {path}, the divisor of "
+                       f"{divisor} leaves it with {song.beatsPerMinute} beats "
+                       f"per minute!")
+    elif args.preview is not None:
+        if args.bundle is not None:
+            args.preview.mkdir(parents=True, exist_ok=True)
+            # Use the constant name so files with the same name in different
+            # directories don't overwrite each other
+            preview_path = args.preview / f"{bundle_writer.name_for(path)}.wav"
+        else:
+            preview_path = args.preview
+        stats = write_preview(preview_path, song)
+        logger.info(f"Wrote preview of {path} to {preview_path}: "
+                    f"{stats.duration:.2f}s, peak {stats.peak_dbfs:.1f} dBFS, "
+                    f"RMS {stats.rms_dbfs:.1f} dBFS, "
+                    f"{stats.clipped_samples} clipped samples")
+    return song
+
+
+def encode(path: Path, song: Song) -> Union[EncodedSong, bytes]:
+    if bundle_writer is not None:
+        return bundle_writer.encode_song(path, song)
+    bin_result = encodeSong(song)
+    logger.debug(f"Generated {len(bin_result)} bytes")
+    return bin_result
+
+
+def write_songs(songs: Iterable[tuple[Path, Union[EncodedSong, bytes]]]):
+    if bundle_writer is not None:
+        # Nothing is written until every song converted, so a bad input never
+        # leaves half a bundle behind
+        encoded_songs = (encoded for _, encoded in songs)
+        if output_path is None:
+            logger.debug("No output path provided, printing to standard "
+                         "output")
+            buffer = StringIO()
+            total_size = bundle_writer.write(buffer, encoded_songs)
+            sys.stdout.write(buffer.getvalue())
+        else:
+            logger.debug(f"Writing to {output_path}")
+            total_size = write_atomically(
+                Path(output_path),
+                lambda file: bundle_writer.write(file, encoded_songs)
+            )
+        if args.size_report:
+            bundle_writer.log_size_report()
+        logger.info(f"Bundled {len(bundle_writer.sizes)} songs, "
+                    f"{total_size} bytes total")
+        return
+
+    songs = list(songs)
+    if len(songs) == 0:
+        logger.warning("Nothing was converted, not writing anything")
+        return
+    result = bytes_to_hex_literal(songs[0][1], char_break)
+    logger.debug(f"Hex string result is {len(result)} characters long")
+
+    if output_path is None:
+        logger.debug("No output path provided, printing to standard output")
+        print(result)
+    else:
+        logger.debug(f"Writing to {output_path}")
+        write_atomically(Path(output_path), lambda file: file.write(result))
+
+
+if not args.watch:
+    write_songs((path, encode(path, convert_midi(path)))
+                for path in input_paths)
 else:
-    logger.debug(f"Writing to {output_path}")
-    Path(output_path).write_text(result)
+    # Keep writing logs from slowing down reconverting
+    start_queue_logging(level=args.debug)
+    watcher = MidiWatcher(args.input, args.debounce)
+
+    def convert_watched(path: Path) -> Optional[Union[EncodedSong, bytes]]:
+        # Half-written or broken exports are expected while composing, so
+        # they shouldn't stop watching. Encoding is guarded too, since a song
+        # can convert fine and still be too long for the song format.
+        try:
+            song = process_song(path, watcher.convert(path, track_id, divisor))
+            return encode(path, song)
+        except Exception:
+            logger.exception(f"Could not convert {path}, keeping the last "
+                             f"good conversion")
+            return None
+
+    # The last good encoded song of every file
+    converted = {}
+    for path in input_paths:
+        encoded = convert_watched(path)
+        if encoded is not None:
+            converted[path] = encoded
+    write_songs(sorted(converted.items()))
+    logger.info(f"Watching {', '.join(str(p) for p in args.input)} for "
+                f"changes, press Ctrl+C to stop")
+    try:
+        while True:
+            sleep(args.interval)
+            changes = watcher.poll()
+            if len(changes) == 0:
+                continue
+            failed = set()
+            for change in changes:
+                if change.removed:
+                    converted.pop(change.path, None)
+                    continue
+                encoded = convert_watched(change.path)
+                if encoded is None:
+                    failed.add(change.path)
+                else:
+                    converted[change.path] = encoded
+            watcher.prune()
+            if len(failed) < len(changes):
+                write_songs(sorted(converted.items()))
+            for change in changes:
+                latency = round((monotonic() - change.detected_at) * 1000)
+                if change.removed:
+                    action = "Removed"
+                elif change.path in failed:
+                    action = "Failed to convert"
+                else:
+                    action = "Reconverted"
+                logger.info(f"{action} {change.path} {latency} ms after "
+                            f"the change was detected")
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+    finally:
+        stop_queue_logging()
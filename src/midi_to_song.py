@@ -13,19 +13,20 @@ from utils.logger import create_logger
 logger = create_logger(name=__name__, level=logging.INFO)
 
 
-def midi_to_song(midi: MidiFile, track_id: Union[str, int],
-                 divisor: float) -> Song:
-    def get_track_from_name_or_id(name_or_id: Union[int, str]) -> Track:
-        logger.debug(f"Finding track {name_or_id}")
-        for track in get_available_tracks():
-            if name_or_id == track.name.lower() or name_or_id == track.id:
-                selected_track = track
-                break
-        else:
-            raise ValueError(f"Unknown track ID or name {name_or_id}!")
-        logger.debug(f"Found track '{selected_track.name}' ({selected_track})")
-        return selected_track
+ChordSimpleEvent = namedtuple("ChordSimpleEvent",
+                              "notes velocities start_tick end_tick")
+ParsedMidi = namedtuple("ParsedMidi", "chords ending_tick")
 
+
+def parse_midi(midi: MidiFile) -> ParsedMidi:
+    """
+    Gathers the chords of a MIDI file. This does not depend on the track or
+    divisor, so it can be reused to convert the same MIDI file with different
+    settings.
+
+    :param midi: The MidiFile to parse.
+    :return: A ParsedMidi with the chords and the last tick of the MIDI file.
+    """
     def find_note_time(start_index: int, note: int,
                        msgs: list[Message]) -> float:
         time = 0
@@ -63,9 +64,7 @@ def midi_to_song(midi: MidiFile, track_id: Union[str, int],
         )
 
     NoteSimpleEvent = namedtuple("NoteSimpleEvent",
-                                 "note start_tick end_tick")
-    ChordSimpleEvent = namedtuple("ChordSimpleEvent",
-                                  "notes start_tick end_tick")
+                                 "note velocity start_tick end_tick")
 
     def find_chord_with_start_tick(chords: list[ChordSimpleEvent],
                                    start_tick: int) -> int:
@@ -74,15 +73,6 @@ def midi_to_song(midi: MidiFile, track_id: Union[str, int],
                 return i
         return -1
 
-    def add_tracks_for_piano(song: Song, track_id: Union[int, str]):
-        selected_track = get_track_from_name_or_id(track_id)
-        selected_higher_track = get_track_from_name_or_id(track_id)
-        song.tracks.append(selected_track)
-        song.tracks[-1].instrument.octave = 2
-        song.tracks.append(selected_higher_track)
-        song.tracks[-1].instrument.octave = 7
-        logger.debug(f"Added 2 piano tracks")
-
     msgs = list(midi)
     simple_notes = []
 
@@ -99,6 +89,7 @@ def midi_to_song(midi: MidiFile, track_id: Union[str, int],
         else:
             note_info = gather_note_info(i, msgs, curr_time)
             note_simple_event = NoteSimpleEvent(note_info.note_value,
+                                                msg.velocity,
                                                 note_info.start_tick,
                                                 note_info.end_tick)
             ending_tick = max(ending_tick, note_info.end_tick)
@@ -108,21 +99,60 @@ def midi_to_song(midi: MidiFile, track_id: Union[str, int],
             #              f"(duration: {duration})")
             simple_notes.append(note_simple_event)
 
-    logger.debug(f"Last tick is {ending_tick} ({round(ending_tick / divisor)} "
-                 f"after divisor)")
-
-    ending_tick = round(ending_tick / divisor)
-
     simple_chords = []
     for note in simple_notes:
         chord_index = find_chord_with_start_tick(simple_chords,
                                                  note.start_tick)
         if chord_index == -1:
             simple_chords.append(
-                ChordSimpleEvent([note.note], note.start_tick, note.end_tick)
+                ChordSimpleEvent([note.note], [note.velocity],
+                                 note.start_tick, note.end_tick)
             )
         else:
             simple_chords[chord_index].notes.append(note.note)
+            simple_chords[chord_index].velocities.append(note.velocity)
+
+    logger.debug(f"Last tick is {ending_tick}")
+
+    return ParsedMidi(simple_chords, ending_tick)
+
+
+def parsed_midi_to_song(parsed: ParsedMidi, track_id: Union[str, int],
+                        divisor: float) -> Song:
+    """
+    Converts a parsed MIDI file to an Arcade song.
+
+    :param parsed: The ParsedMidi from parse_midi.
+    :param track_id: The name or ID of the track to use.
+    :param divisor: A divisor to reduce the number of measures used.
+    :return: The Song.
+    """
+    def get_track_from_name_or_id(name_or_id: Union[int, str]) -> Track:
+        logger.debug(f"Finding track {name_or_id}")
+        for track in get_available_tracks():
+            if name_or_id == track.name.lower() or name_or_id == track.id:
+                selected_track = track
+                break
+        else:
+            raise ValueError(f"Unknown track ID or name {name_or_id}!")
+        logger.debug(f"Found track '{selected_track.name}' ({selected_track})")
+        return selected_track
+
+    def add_tracks_for_piano(song: Song, track_id: Union[int, str]):
+        selected_track = get_track_from_name_or_id(track_id)
+        selected_higher_track = get_track_from_name_or_id(track_id)
+        song.tracks.append(selected_track)
+        song.tracks[-1].instrument.octave = 2
+        song.tracks.append(selected_higher_track)
+        song.tracks[-1].instrument.octave = 7
+        logger.debug(f"Added 2 piano tracks")
+
+    simple_chords = parsed.chords
+
+    logger.debug(f"Last tick is {parsed.ending_tick} "
+                 f"({round(parsed.ending_tick / divisor)} after divisor)")
+
+    ending_tick = round(parsed.ending_tick / divisor)
 
     ticks_per_beat = 100
     beats_per_measure = 10
@@ -145,8 +175,9 @@ def midi_to_song(midi: MidiFile, track_id: Union[str, int],
 
     for i, chord in enumerate(simple_chords):
         # logger.debug(f"Chord {i}: {chord}")
-        all_notes = [Note(note=n, enharmonicSpelling=EnharmonicSpelling.NORMAL)
-                     for n in chord.notes]
+        all_notes = [Note(note=n, enharmonicSpelling=EnharmonicSpelling.NORMAL,
+                          velocity=v)
+                     for n, v in zip(chord.notes, chord.velocities)]
         notes = []
         higher_notes = []
         for note in all_notes:
@@ -182,3 +213,8 @@ def midi_to_song(midi: MidiFile, track_id: Union[str, int],
     logger.debug(f"Last tick is {ending_tick}")
 
     return song
+
+
+def midi_to_song(midi: MidiFile, track_id: Union[str, int],
+                 divisor: float) -> Song:
+    return parsed_midi_to_song(parse_midi(midi), track_id, divisor)
@@ -0,0 +1,164 @@
+import logging
+from collections import namedtuple
+from copy import deepcopy
+from hashlib import blake2b
+from io import BytesIO
+from pathlib import Path
+from time import monotonic
+from typing import Iterable, Union
+
+from mido import MidiFile
+
+from arcade.music import Song
+from midi_to_song import ParsedMidi, parse_midi, parsed_midi_to_song
+from utils.logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+MIDI_SUFFIXES = (".mid", ".midi")
+
+FileChange = namedtuple("FileChange", "path detected_at removed")
+
+
+def find_midi_files(paths: Iterable[Path]) -> list[Path]:
+    """
+    Expands directories to the MIDI files directly inside them. Paths to files
+    are kept as is.
+
+    :param paths: An iterable of Paths to files or directories.
+    :return: A list of Paths to MIDI files.
+    """
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files += sorted(p for p in path.iterdir()
+                            if p.is_file() and
+                            p.suffix.lower() in MIDI_SUFFIXES)
+        else:
+            files.append(path)
+    return files
+
+
+class MidiWatcher:
+    """
+    Watches MIDI files (and directories of MIDI files) for changes by polling
+    their modification time and size, so it works the same on every OS.
+
+    A file only counts as changed once its stats have stopped changing for the
+    debounce time and its content hash is different from the last time it was
+    converted. Parsed MIDI files are cached by content hash, so converting the
+    same content with a different track or divisor skips parsing.
+    """
+
+    def __init__(self, paths: Iterable[Path], debounce: float = 0.5):
+        """
+        :param paths: An iterable of Paths to MIDI files or directories.
+        :param debounce: How many seconds a file's stats need to stay the
+         same before it is reconverted. Defaults to 0.5.
+        """
+        self.paths = list(paths)
+        self.debounce = debounce
+        self._stats: dict[Path, tuple[int, int]] = {}
+        self._hashes: dict[Path, str] = {}
+        self._pending: dict[Path, tuple[float, float]] = {}
+        self._parsed: dict[str, ParsedMidi] = {}
+        self._songs: dict[tuple[str, Union[str, int], float], Song] = {}
+
+    def poll(self) -> list[FileChange]:
+        """
+        Checks all the watched files once.
+
+        :return: A list of FileChanges for every file whose content changed
+         (or that was added or removed) since the last poll.
+        """
+        now = monotonic()
+        changes = []
+        files = find_midi_files(self.paths)
+
+        for path in list(self._stats):
+            if path not in files or not path.exists():
+                logger.debug(f"{path} was removed")
+                self._forget(path)
+                changes.append(FileChange(path, now, True))
+
+        for path in files:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            stats = (stat.st_mtime_ns, stat.st_size)
+            if stats != self._stats.get(path):
+                self._stats[path] = stats
+                detected_at = self._pending.get(path, (now, now))[0]
+                self._pending[path] = (detected_at, now)
+                continue
+            if path not in self._pending:
+                continue
+            detected_at, last_change = self._pending[path]
+            if now - last_change < self.debounce:
+                continue
+            del self._pending[path]
+            try:
+                digest = blake2b(path.read_bytes()).hexdigest()
+            except OSError:
+                # Removed or still locked, the next poll will tell
+                logger.debug(f"Could not read {path}, checking again later")
+                continue
+            if digest == self._hashes.get(path):
+                logger.debug(f"{path} was touched but its content is the "
+                             f"same")
+                continue
+            self._hashes[path] = digest
+            changes.append(FileChange(path, detected_at, False))
+
+        return changes
+
+    def _forget(self, path: Path):
+        self._stats.pop(path, None)
+        self._pending.pop(path, None)
+        self._hashes.pop(path, None)
+
+    def convert(self, path: Path, track_id: Union[str, int],
+                divisor: float) -> Song:
+        """
+        Converts a MIDI file to a song, reusing the cached parse or song when
+        the content (and settings) have already been converted. The returned
+        song is a copy, so changing it doesn't change the cache.
+
+        :param path: A Path to the MIDI file.
+        :param track_id: The name or ID of the track to use.
+        :param divisor: A divisor to reduce the number of measures used.
+        :return: The Song.
+        :raises OSError: If the file can't be read.
+        :raises Exception: Whatever mido raises if the file isn't a valid MIDI
+         file.
+        """
+        stat = path.stat()
+        self._stats[path] = (stat.st_mtime_ns, stat.st_size)
+        data = path.read_bytes()
+        digest = blake2b(data).hexdigest()
+        self._hashes[path] = digest
+        key = (digest, track_id, divisor)
+        song = self._songs.get(key)
+        if song is not None:
+            logger.debug(f"Reusing converted song for {path}")
+            return deepcopy(song)
+        parsed = self._parsed.get(digest)
+        if parsed is None:
+            parsed = parse_midi(MidiFile(file=BytesIO(data)))
+            self._parsed[digest] = parsed
+        else:
+            logger.debug(f"Reusing parsed MIDI for {path}")
+        song = parsed_midi_to_song(parsed, track_id, divisor)
+        self._songs[key] = song
+        return deepcopy(song)
+
+    def prune(self):
+        """
+        Drops cached parses and songs of content that no watched file has
+        anymore.
+        """
+        digests = set(self._hashes.values())
+        self._parsed = {d: p for d, p in self._parsed.items() if d in digests}
+        self._songs = {k: s for k, s in self._songs.items()
+                       if k[0] in digests}
@@ -0,0 +1,157 @@
+import logging
+from collections import namedtuple
+
+from arcade.music import Song, Track
+from utils.logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+PRIORITIES = ("velocity", "shortest", "inner")
+
+Voice = namedtuple("Voice", "start_tick end_tick note event")
+Hotspot = namedtuple("Hotspot", "start_tick end_tick voices")
+PolyphonyReport = namedtuple("PolyphonyReport", "max_voices hotspots")
+
+
+def get_voices(track: Track) -> list[Voice]:
+    """
+    Gets every note in a track as a voice. Notes in events that don't last
+    for at least a tick never sound, so they are left out.
+
+    :param track: The Track to get the voices of.
+    :return: A list of Voices sorted by start tick.
+    """
+    voices = [Voice(event.startTick, event.endTick, note, event)
+              for event in track.notes if event.endTick > event.startTick
+              for note in event.notes]
+    voices.sort(key=lambda v: v.start_tick)
+    return voices
+
+
+def analyze_polyphony(track: Track, threshold: int) -> PolyphonyReport:
+    """
+    Sweeps over the notes of a track to find how many voices sound at once.
+    This is O(n log n) in the number of notes.
+
+    :param track: The Track to analyze.
+    :param threshold: Spans with more voices than this are reported as
+     hotspots.
+    :return: A PolyphonyReport with the most voices that ever sound at once
+     and a list of Hotspots, each with the most voices during it.
+    """
+    points = []
+    for voice in get_voices(track):
+        points.append((voice.start_tick, 1))
+        points.append((voice.end_tick, -1))
+    # Notes ending on a tick stop before notes starting on that tick
+    points.sort()
+
+    max_voices = 0
+    hotspots = []
+    active = 0
+    hotspot_start = None
+    hotspot_peak = 0
+    i = 0
+    while i < len(points):
+        tick = points[i][0]
+        while i < len(points) and points[i][0] == tick:
+            active += points[i][1]
+            i += 1
+        max_voices = max(max_voices, active)
+        if active > threshold:
+            if hotspot_start is None:
+                hotspot_start = tick
+                hotspot_peak = 0
+            hotspot_peak = max(hotspot_peak, active)
+        elif hotspot_start is not None:
+            hotspots.append(Hotspot(hotspot_start, tick, hotspot_peak))
+            hotspot_start = None
+    return PolyphonyReport(max_voices, hotspots)
+
+
+def _pick_voice_to_drop(active: list[Voice], priority: str) -> Voice:
+    # Ties drop the voice that started last, so notes already sounding win
+    if priority == "velocity":
+        return min(active, key=lambda v: (
+            127 if v.note.velocity is None else v.note.velocity,
+            -v.start_tick
+        ))
+    elif priority == "shortest":
+        return min(active, key=lambda v: (v.end_tick - v.start_tick,
+                                          -v.start_tick))
+    elif priority == "inner":
+        by_pitch = sorted(active, key=lambda v: v.note.note)
+        # Keep the highest and lowest voices, or just the highest if there
+        # is no inner voice
+        inner = by_pitch[1:-1] if len(by_pitch) > 2 else by_pitch[:-1]
+        return max(inner, key=lambda v: v.start_tick)
+    else:
+        raise ValueError(f"Unknown polyphony priority {priority}, must be "
+                         f"one of {PRIORITIES}!")
+
+
+def limit_polyphony(track: Track, max_voices: int,
+                    priority: str = "velocity") -> int:
+    """
+    Drops notes from a track so no more than so many voices sound at once.
+    Notes are dropped whole, and events left without notes are removed.
+
+    :param track: The Track to limit. It is changed in place.
+    :param max_voices: The most voices that may sound at once. Must be at
+     least 1.
+    :param priority: Which voice to drop when there are too many: "velocity"
+     drops the quietest, "shortest" drops the shortest and "inner" drops
+     voices between the highest and lowest ones. Defaults to "velocity".
+    :return: The number of notes dropped.
+    """
+    if max_voices < 1:
+        raise ValueError(f"max_voices must be an integer greater than or "
+                         f"equal to 1, not {max_voices}!")
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown polyphony priority {priority}, must be "
+                         f"one of {PRIORITIES}!")
+
+    # The active voices never grow past max_voices + 1, so the sweep stays
+    # cheap next to sorting the voices
+    dropped: dict[int, set[int]] = {}
+    active: list[Voice] = []
+    for voice in get_voices(track):
+        active = [v for v in active if v.end_tick > voice.start_tick]
+        active.append(voice)
+        if len(active) > max_voices:
+            victim = _pick_voice_to_drop(active, priority)
+            active = [v for v in active if v is not victim]
+            dropped.setdefault(id(victim.event), set()).add(id(victim.note))
+
+    count = 0
+    for event in track.notes:
+        dropped_notes = dropped.get(id(event))
+        if dropped_notes is None:
+            continue
+        kept = [n for n in event.notes if id(n) not in dropped_notes]
+        count += len(event.notes) - len(kept)
+        event.notes = kept
+    track.notes = [e for e in track.notes if len(e.notes) > 0]
+    return count
+
+
+def log_polyphony_report(song: Song, threshold: int):
+    """
+    Logs the most voices in every track of a song and where there are more
+    voices than the threshold.
+
+    :param song: The Song to report on.
+    :param threshold: Spans with more voices than this are reported.
+    """
+    ticks_per_measure = song.ticksPerBeat * song.beatsPerMeasure
+    for i, track in enumerate(song.tracks):
+        report = analyze_polyphony(track, threshold)
+        logger.info(f"Track {i} ({track.name}) has up to "
+                    f"{report.max_voices} voices at once, "
+                    f"{len(report.hotspots)} spans with more than "
+                    f"{threshold}")
+        for hotspot in report.hotspots:
+            logger.info(f"    measure "
+                        f"{hotspot.start_tick // ticks_per_measure + 1}: "
+                        f"ticks {hotspot.start_tick}-{hotspot.end_tick}, "
+                        f"{hotspot.voices} voices")
@@ -0,0 +1,155 @@
+import logging
+import re
+from collections import namedtuple
+from pathlib import Path
+from typing import Iterable, TextIO
+
+from arcade.music import Song, encodeInstrument, encodeSongWithTracks, \
+    encodeTrack
+from utils.hex_string import bytes_to_hex_literal
+from utils.logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+TrackSize = namedtuple("TrackSize", "track_id name size header")
+SongSize = namedtuple("SongSize", "name size tracks")
+EncodedSong = namedtuple("EncodedSong", "data size")
+
+
+def make_constant_name(path: Path, taken: set[str]) -> str:
+    """
+    Makes a TypeScript identifier out of a file name that is not already in
+    use.
+
+    :param path: A Path to the file the song came from.
+    :param taken: A set of names already in use. The new name is added to it.
+    :return: A string with the identifier.
+    """
+    name = re.sub(r"\W+", "_", path.stem).strip("_")
+    if name == "" or name[0].isdigit():
+        name = f"song_{name}"
+    unique_name = name
+    suffix = 2
+    while unique_name in taken:
+        unique_name = f"{name}_{suffix}"
+        suffix += 1
+    taken.add(unique_name)
+    return unique_name
+
+
+class SongBundleWriter:
+    """
+    Writes many songs into a single MakeCode Arcade TypeScript namespace,
+    with one `music.createSong` constant per song. The same writer can write
+    the bundle again (like after a song changes), and every file keeps the
+    constant name it got the first time.
+
+    The writer also keeps the size of every song and track so you can check
+    the bundle against your flash budget. Every track in the song format
+    carries its own instrument header, so the size report also tells how many
+    bytes go to headers that an earlier track already had.
+    """
+
+    def __init__(self, namespace: str, char_break: int = 0):
+        """
+        :param namespace: The name of the TypeScript namespace to write.
+        :param char_break: Break the hex strings after so many bytes.
+         Defaults to 0 for no breaking.
+        """
+        self.namespace = namespace
+        self.char_break = char_break
+        self.sizes: list[SongSize] = []
+        self._names: set[str] = set()
+        self._names_by_path: dict[Path, str] = {}
+
+    def name_for(self, path: Path) -> str:
+        """
+        Gets the constant name of the song from a file, making a unique one
+        the first time.
+
+        :param path: A Path to the MIDI file the song came from.
+        :return: A string with the constant name.
+        """
+        name = self._names_by_path.get(path)
+        if name is None:
+            name = make_constant_name(path, self._names)
+            self._names_by_path[path] = name
+        return name
+
+    def encode_song(self, path: Path, song: Song) -> EncodedSong:
+        """
+        Encodes a song and measures it and its tracks.
+
+        :param path: A Path to the MIDI file the song came from.
+        :param song: The Song to encode.
+        :return: An EncodedSong with the encoded song and its SongSize.
+        :raises struct.error: If a tick or the tempo doesn't fit in 16 bits.
+        """
+        encoded_tracks = []
+        track_sizes = []
+        for track in song.tracks:
+            if len(track.notes) == 0:
+                continue
+            encoded_track = encodeTrack(track)
+            encoded_tracks.append(encoded_track)
+            header = bytes(encodeInstrument(track.instrument))
+            track_sizes.append(TrackSize(track.id, track.name,
+                                         len(encoded_track), header))
+        encoded_song = encodeSongWithTracks(song, encoded_tracks)
+        return EncodedSong(encoded_song, SongSize(self.name_for(path),
+                                                  len(encoded_song),
+                                                  track_sizes))
+
+    def write(self, fp: TextIO, songs: Iterable[EncodedSong]) -> int:
+        """
+        Writes all the songs to a file in one pass, and keeps their sizes for
+        the size report.
+
+        :param fp: The text file to write to.
+        :param songs: An iterable of EncodedSongs from encode_song.
+        :return: The total number of bytes of all encoded songs.
+        """
+        total = 0
+        self.sizes = []
+        fp.write(f"namespace {self.namespace} {{\n")
+        for song in songs:
+            name = song.size.name
+            self.sizes.append(song.size)
+            total += len(song.data)
+            literal = bytes_to_hex_literal(song.data, self.char_break,
+                                           indent=" " * 8)
+            if self.char_break != 0:
+                literal = literal[:-1] + "    `"
+            fp.write(f"    export const {name} = "
+                     f"music.createSong({literal});\n")
+            logger.debug(f"Wrote {name} ({len(song.data)} bytes)")
+        fp.write("}\n")
+        return total
+
+    def get_repeated_header_bytes(self) -> int:
+        """
+        Counts the bytes of the last write that are instrument headers an
+        earlier track already had.
+
+        :return: The number of bytes.
+        """
+        seen = set()
+        repeated = 0
+        for song_size in self.sizes:
+            for track_size in song_size.tracks:
+                if track_size.header in seen:
+                    repeated += len(track_size.header)
+                seen.add(track_size.header)
+        return repeated
+
+    def log_size_report(self):
+        """
+        Logs the size of every song and track from the last write.
+        """
+        for song_size in self.sizes:
+            logger.info(f"{song_size.name}: {song_size.size} bytes")
+            for track_size in song_size.tracks:
+                logger.info(f"    track {track_size.track_id} "
+                            f"({track_size.name}): {track_size.size} bytes")
+        logger.info(f"{self.get_repeated_header_bytes()} bytes are instrument "
+                    f"headers repeated from an earlier track")
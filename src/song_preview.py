@@ -0,0 +1,225 @@
+import logging
+import wave
+from collections import namedtuple
+from pathlib import Path
+from time import perf_counter
+from typing import Optional
+
+import numpy as np
+
+from arcade.music import Envelope, Instrument, Song, Track, isNoteInRange
+from utils.logger import create_logger
+
+logger = create_logger(name=__name__, level=logging.INFO)
+
+SAMPLE_RATE = 44100
+
+PreviewStats = namedtuple("PreviewStats",
+                          "duration peak_dbfs rms_dbfs clipped_samples")
+
+
+def note_to_frequency(note: np.ndarray) -> np.ndarray:
+    """
+    Converts MIDI note numbers to frequencies in Hz, with note 69 at 440 Hz.
+
+    :param note: An array of note numbers.
+    :return: An array of frequencies.
+    """
+    return 440 * 2 ** ((note - 69) / 12)
+
+
+def render_envelope(envelope: Envelope, t: np.ndarray,
+                    gate: float) -> np.ndarray:
+    """
+    Renders an ADSR envelope. The attack, decay and release are in
+    milliseconds, and the sustain level and amplitude go from 0 to 1024.
+
+    :param envelope: The Envelope to render.
+    :param t: An array of times in seconds since the note started.
+    :param gate: How many seconds the note is held before it is released.
+    :return: An array with the envelope from 0 to amplitude / 1024.
+    """
+    peak = envelope.amplitude / 1024
+    attack = envelope.attack / 1000
+    decay = envelope.decay / 1000
+    release = max(envelope.release / 1000, 1 / SAMPLE_RATE)
+    sustain = peak * envelope.sustain / 1024
+    xp = [0, attack, attack + decay]
+    fp = [0, peak, sustain]
+    held = np.interp(np.minimum(t, gate), xp, fp)
+    released = np.clip(1 - (t - gate) / release, 0, 1)
+    return np.where(t < gate, held, held * released)
+
+
+def render_waveform(waveform: int, cycles: np.ndarray,
+                    rng: np.random.Generator) -> np.ndarray:
+    """
+    Renders an Arcade waveform from the number of cycles it has gone through.
+
+    :param waveform: The waveform ID of the instrument.
+    :param cycles: An array of how many cycles have passed at every sample.
+    :param rng: A random number generator for the noise waveforms.
+    :return: An array of samples from -1 to 1.
+    """
+    phase = cycles % 1
+    if waveform == 1:
+        return 4 * np.abs(phase - 0.5) - 1
+    elif waveform == 2:
+        return 2 * phase - 1
+    elif waveform == 5:
+        return rng.uniform(-1, 1, cycles.shape)
+    elif waveform == 4 or 16 <= waveform <= 20:
+        # Tunable and cycle noise hold a random value for every half cycle
+        steps = np.floor(cycles * 2).astype(np.int64)
+        steps -= steps.min(initial=0)
+        values = rng.uniform(-1, 1, steps.max(initial=0) + 1)
+        return values[steps]
+    elif 11 <= waveform <= 15:
+        duty = (waveform - 10) / 10
+        return np.where(phase < duty, 1.0, -1.0)
+    else:
+        return np.sin(2 * np.pi * cycles)
+
+
+def render_track(track: Track, out: np.ndarray, seconds_per_tick: float,
+                 rng: np.random.Generator, gain: float):
+    """
+    Renders every note of a track and mixes it into a buffer. The notes of
+    each event are rendered together as one block. Notes out of the range of
+    the track's octave are skipped, like encodeNote does.
+
+    :param track: The Track to render.
+    :param out: The buffer to mix into.
+    :param seconds_per_tick: How many seconds a tick lasts.
+    :param rng: A random number generator for the noise waveforms.
+    :param gain: How loud a note at full amplitude is.
+    """
+    instrument: Instrument = track.instrument
+    release = instrument.ampEnvelope.release / 1000
+    for event in track.notes:
+        notes = [n for n in event.notes
+                 if isNoteInRange(n, instrument.octave)]
+        if len(notes) == 0:
+            continue
+        start = round(event.startTick * seconds_per_tick * SAMPLE_RATE)
+        if start >= len(out):
+            continue
+        gate = max(event.endTick - event.startTick, 0) * seconds_per_tick
+        length = min(round((gate + release) * SAMPLE_RATE), len(out) - start)
+        t = np.arange(length) / SAMPLE_RATE
+
+        amp = render_envelope(instrument.ampEnvelope, t, gate)
+        if instrument.ampLFO is not None:
+            # Scaled by the envelope so it stops when the note does
+            amp = amp * np.clip(
+                1 + instrument.ampLFO.amplitude / 1024 *
+                np.sin(2 * np.pi * instrument.ampLFO.frequency * t),
+                0, None
+            )
+
+        freq_offset = np.zeros(length)
+        if instrument.pitchEnvelope is not None:
+            freq_offset += render_envelope(instrument.pitchEnvelope, t,
+                                           gate) * 1024
+        if instrument.pitchLFO is not None:
+            freq_offset += (instrument.pitchLFO.amplitude *
+                            np.sin(2 * np.pi *
+                                   instrument.pitchLFO.frequency * t))
+
+        # One row per note in the event
+        base = note_to_frequency(np.array([n.note for n in notes],
+                                          dtype=np.float64))
+        freq = np.clip(base[:, None] + freq_offset[None, :], 0, None)
+        cycles = np.cumsum(freq, axis=1) / SAMPLE_RATE
+        samples = render_waveform(instrument.waveform, cycles, rng)
+        out[start:start + length] += gain * amp * samples.sum(axis=0)
+
+
+def render_song(song: Song, gain: float = 0.25,
+                seed: Optional[int] = 0) -> np.ndarray:
+    """
+    Renders a song to mono audio at SAMPLE_RATE. Note numbers are treated as
+    MIDI note numbers, which is what midi_to_song makes.
+
+    :param song: The Song to render.
+    :param gain: How loud a note at full amplitude is. Defaults to 0.25.
+    :param seed: The seed for the noise waveforms, or None for a random one.
+     Defaults to 0 so previews are the same every time.
+    :return: A float64 array of samples. Samples outside -1 to 1 will clip
+     when written.
+    """
+    if song.beatsPerMinute < 1 or song.ticksPerBeat < 1:
+        raise ValueError(f"Can't render a song with {song.beatsPerMinute} "
+                         f"beats per minute and {song.ticksPerBeat} ticks per "
+                         f"beat!")
+    seconds_per_tick = 60 / (song.beatsPerMinute * song.ticksPerBeat)
+    end = 0
+    for track in song.tracks:
+        release = track.instrument.ampEnvelope.release / 1000
+        for event in track.notes:
+            end = max(end, event.endTick * seconds_per_tick + release)
+    out = np.zeros(round(end * SAMPLE_RATE) + 1)
+    rng = np.random.default_rng(seed)
+    for track in song.tracks:
+        render_track(track, out, seconds_per_tick, rng, gain)
+    return out
+
+
+def get_preview_stats(samples: np.ndarray) -> PreviewStats:
+    """
+    Measures how long and how loud rendered audio is.
+
+    :param samples: The samples from render_song.
+    :return: A PreviewStats with the duration in seconds, the peak and RMS
+     levels in dBFS, and how many samples are outside -1 to 1.
+    """
+    if len(samples) == 0:
+        return PreviewStats(0, -np.inf, -np.inf, 0)
+    peak = np.max(np.abs(samples))
+    rms = np.sqrt(np.mean(samples ** 2))
+    with np.errstate(divide="ignore"):
+        peak_dbfs = 20 * np.log10(peak)
+        rms_dbfs = 20 * np.log10(rms)
+    return PreviewStats(
+        duration=len(samples) / SAMPLE_RATE,
+        peak_dbfs=float(peak_dbfs),
+        rms_dbfs=float(rms_dbfs),
+        clipped_samples=int(np.count_nonzero(np.abs(samples) > 1))
+    )
+
+
+def write_wav(path: Path, samples: np.ndarray):
+    """
+    Writes samples to a 16-bit mono WAV file, clipping them to -1 to 1.
+
+    :param path: A Path to the WAV file.
+    :param samples: The samples from render_song.
+    """
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(SAMPLE_RATE)
+        file.writeframes(pcm.tobytes())
+
+
+def write_preview(path: Path, song: Song, gain: float = 0.25) -> PreviewStats:
+    """
+    Renders a song to a WAV file.
+
+    :param path: A Path to the WAV file.
+    :param song: The Song to render.
+    :param gain: How loud a note at full amplitude is. Defaults to 0.25.
+    :return: The PreviewStats of the rendered audio.
+    :raises ValueError: If the song has no beats per minute or ticks per
+     beat, like with a divisor above 120.
+    """
+    start = perf_counter()
+    samples = render_song(song, gain)
+    stats = get_preview_stats(samples)
+    write_wav(path, samples)
+    elapsed = perf_counter() - start
+    logger.debug(f"Rendered {stats.duration:.2f}s of audio in "
+                 f"{elapsed:.2f}s ({stats.duration / max(elapsed, 1e-9):.0f}x "
+                 f"real time)")
+    return stats
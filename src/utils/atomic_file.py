@@ -0,0 +1,28 @@
+import os
+from pathlib import Path
+from tempfile import mkstemp
+from typing import Callable, TextIO, TypeVar
+
+T = TypeVar("T")
+
+
+def write_atomically(path: Path, write: Callable[[TextIO], T]) -> T:
+    """
+    Writes a text file through a temporary file next to it, and only replaces
+    the file once everything was written. If writing fails, the old file is
+    left as it was.
+
+    :param path: A Path to the file to write.
+    :param write: A function that writes to the text file it is given.
+    :return: Whatever write returns.
+    """
+    fd, temp_path = mkstemp(dir=path.parent, prefix=f".{path.name}.",
+                            suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            result = write(file)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return result
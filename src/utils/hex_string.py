@@ -0,0 +1,18 @@
+def bytes_to_hex_literal(data: bytes, char_break: int = 0,
+                         indent: str = "    ") -> str:
+    """
+    Converts bytes to a MakeCode hex literal, like hex`0102ff`.
+
+    :param data: The bytes to convert.
+    :param char_break: Break the hex string after so many bytes. Defaults to
+     0 for no breaking.
+    :param indent: The string put in front of every broken line. Defaults to
+     4 spaces.
+    :return: A string with the hex literal.
+    """
+    hex_str = bytes(data).hex()
+    if char_break == 0:
+        return f"hex`{hex_str}`"
+    step = char_break * 2
+    lines = [hex_str[i:i + step] for i in range(0, len(hex_str), step)]
+    return "hex`" + "".join(f"\n{indent}{line}" for line in lines) + "\n`"
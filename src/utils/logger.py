@@ -1,5 +1,104 @@
 import logging
 import sys
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from queue import Queue
+from typing import Optional
+
+CONSOLE_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+QUEUE_CONSOLE_FORMAT = "%(asctime)s - %(processName)s - %(name)s - " \
+                       "%(levelname)s - %(message)s"
+
+# All the loggers made with create_logger, so we never have to walk (or
+# guess at) every logger in the process
+_loggers: dict[str, logging.Logger] = {}
+_queue_handler: Optional[QueueHandler] = None
+_listener: Optional[QueueListener] = None
+_stdout_redirected = False
+
+
+class ConsoleHandler(logging.StreamHandler):
+    """
+    A stream handler that remembers if it writes to standard output or
+    standard error.
+    """
+
+    def __init__(self, to_stdout: bool):
+        """
+        :param to_stdout: True to write to standard output, False to write to
+         standard error.
+        """
+        super().__init__(stream=sys.stdout if to_stdout else sys.stderr)
+        self.to_stdout = to_stdout
+
+    def redirect_to_stderr(self):
+        """
+        Makes a standard output handler write to standard error instead.
+        Warnings and worse are left out, since the standard error handler
+        already writes them.
+        """
+        if not self.to_stdout or self.stream is sys.stderr:
+            return
+        self.setStream(sys.stderr)
+        self.addFilter(lambda record: record.levelno < logging.WARNING)
+
+
+class WorkerFileRouter(logging.Handler):
+    """
+    A handler that writes the records of every process to its own file,
+    named after the process.
+    """
+
+    def __init__(self, directory: Path):
+        """
+        :param directory: A Path to the directory to put the log files in. It
+         is made if it doesn't exist.
+        """
+        super().__init__()
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._handlers: dict[str, logging.FileHandler] = {}
+
+    def emit(self, record: logging.LogRecord):
+        handler = self._handlers.get(record.processName)
+        if handler is None:
+            handler = logging.FileHandler(
+                self.directory / f"{record.processName}.log"
+            )
+            handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+            self._handlers[record.processName] = handler
+        handler.handle(record)
+
+    def close(self):
+        for handler in self._handlers.values():
+            handler.close()
+        self._handlers.clear()
+        super().close()
+
+
+def _make_console_handlers(level: int, fmt: str) -> list[logging.Handler]:
+    console_formatter = logging.Formatter(fmt)
+
+    # https://stackoverflow.com/a/16066513/10291933
+    stdout_handler = ConsoleHandler(to_stdout=True)
+    stdout_handler.setLevel(level=level)
+    # stdout_handler.addFilter(lambda record: record.levelno <= logging.INFO)
+    stdout_handler.setFormatter(fmt=console_formatter)
+    if _stdout_redirected:
+        stdout_handler.redirect_to_stderr()
+
+    stderr_handler = ConsoleHandler(to_stdout=False)
+    stderr_handler.setLevel(level=logging.WARNING)
+    stderr_handler.setFormatter(fmt=console_formatter)
+
+    return [stdout_handler, stderr_handler]
+
+
+def _set_handlers(logger: logging.Logger, handlers: list[logging.Handler]):
+    for handler in list(logger.handlers):
+        logger.removeHandler(hdlr=handler)
+    for handler in handlers:
+        logger.addHandler(hdlr=handler)
 
 
 def create_logger(name: str, level: int = logging.DEBUG) -> logging.Logger:
@@ -9,6 +108,9 @@ def create_logger(name: str, level: int = logging.DEBUG) -> logging.Logger:
     `logger.info()`, `logger.warning()`, `logger.error()`,
     `logger.critical()`, and `logger.exception` everywhere in that module.
 
+    Calling this again with the same name returns the same logger with the
+    new level, instead of adding more handlers to it.
+
     :param name: A string with the logger name.
     :param level: An integer with the logger level. Defaults to logging.DEBUG.
     :return: A logging.Logger which you can use as a regular logger.
@@ -17,22 +119,17 @@ def create_logger(name: str, level: int = logging.DEBUG) -> logging.Logger:
     logger.setLevel(level=level)
     logger.propagate = False
 
-    console_formatter = logging.Formatter("%(asctime)s - %(name)s - "
-                                          "%(levelname)s - %(message)s")
-
-    # https://stackoverflow.com/a/16066513/10291933
-    stdout_handler = logging.StreamHandler(stream=sys.stdout)
-    stdout_handler.setLevel(level=level)
-    # stdout_handler.addFilter(lambda record: record.levelno <= logging.INFO)
-    stdout_handler.setFormatter(fmt=console_formatter)
-    if stdout_handler not in logger.handlers:
-        logger.addHandler(hdlr=stdout_handler)
-
-    stderr_handler = logging.StreamHandler(stream=sys.stderr)
-    stderr_handler.setLevel(level=logging.WARNING)
-    stderr_handler.setFormatter(fmt=console_formatter)
-    if stderr_handler not in logger.handlers:
-        logger.addHandler(hdlr=stderr_handler)
+    if name not in _loggers:
+        _loggers[name] = logger
+        if _queue_handler is not None:
+            _set_handlers(logger, [_queue_handler])
+        else:
+            _set_handlers(logger, _make_console_handlers(level,
+                                                         CONSOLE_FORMAT))
+    else:
+        for handler in logger.handlers:
+            if isinstance(handler, ConsoleHandler) and handler.to_stdout:
+                handler.setLevel(level=level)
 
     logger.debug(f"Created logger named {repr(name)} with level {repr(level)}")
     logger.debug(f"Handlers for {repr(name)}: {repr(logger.handlers)}")
@@ -44,17 +141,114 @@ logger = create_logger(name=__name__, level=logging.INFO)
 
 def set_all_stdout_logger_levels(level: int):
     """
-    Sets the logging level of all loggers that point to standard output.
+    Sets the logging level of all loggers made with create_logger and of the
+    handlers that point to standard output.
 
     :param level: An integer with the new logger level.
     """
     logger.debug(f"Configuring all stdout handlers to {level}")
-    loggers = [logging.getLogger(name) for name in
-               logging.root.manager.loggerDict]
-    for l in loggers:
+    handlers = [h for l in _loggers.values() for h in l.handlers]
+    if _listener is not None:
+        handlers += _listener.handlers
+    for l in _loggers.values():
+        l.setLevel(level)
+    for h in handlers:
+        if isinstance(h, ConsoleHandler) and h.to_stdout:
+            h.setLevel(level)
+
+
+def redirect_stdout_logs_to_stderr():
+    """
+    Makes every logger write what would go to standard output to standard
+    error instead, including loggers made after this. Use this when the
+    program's actual output is written to standard output.
+    """
+    global _stdout_redirected
+    _stdout_redirected = True
+    handlers = [h for l in _loggers.values() for h in l.handlers]
+    if _listener is not None:
+        handlers += _listener.handlers
+    for h in handlers:
+        if isinstance(h, ConsoleHandler):
+            h.redirect_to_stderr()
+
+
+def start_queue_logging(log_queue: Optional[Queue] = None,
+                        level: int = logging.DEBUG,
+                        worker_log_dir: Optional[Path] = None) \
+        -> QueueListener:
+    """
+    Moves writing log records to a background thread. Every logger made with
+    create_logger (before or after this) puts its records on a queue, and a
+    listener thread writes them to standard output and standard error.
+
+    To also log from a process pool, pass a multiprocessing queue here and
+    use configure_worker_logging as the initializer of the pool with the same
+    queue. Calling this again while the listener is running does nothing.
+
+    :param log_queue: The queue to use. Defaults to a new queue.Queue, which
+     only works in this process.
+    :param level: An integer with the level of the standard output handler.
+     Defaults to logging.DEBUG, so only the logger levels filter records.
+    :param worker_log_dir: If given, a Path to a directory where the records
+     of every process are also written to a file named after the process.
+    :return: The running QueueListener.
+    """
+    global _queue_handler, _listener
+    if _listener is not None:
+        return _listener
+    if log_queue is None:
+        log_queue = Queue()
+
+    handlers = _make_console_handlers(level, QUEUE_CONSOLE_FORMAT)
+    if worker_log_dir is not None:
+        handlers.append(WorkerFileRouter(worker_log_dir))
+
+    _queue_handler = QueueHandler(log_queue)
+    for l in _loggers.values():
+        _set_handlers(l, [_queue_handler])
+    _listener = QueueListener(log_queue, *handlers,
+                              respect_handler_level=True)
+    _listener.start()
+    logger.debug(f"Started queue logging with handlers {handlers}")
+    return _listener
+
+
+def stop_queue_logging():
+    """
+    Writes all the records left on the queue, stops the listener thread and
+    gives every logger its own console handlers back.
+    """
+    global _queue_handler, _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+    _queue_handler = None
+    for l in _loggers.values():
+        _set_handlers(l, _make_console_handlers(l.level, CONSOLE_FORMAT))
+
+
+def configure_worker_logging(log_queue: Queue, level: int = logging.INFO):
+    """
+    Sends the records of every logger in a worker process to the queue of
+    the main process's listener. Use this as the initializer of a process
+    pool, like
+    `ProcessPoolExecutor(initializer=configure_worker_logging,
+    initargs=(log_queue, level))`. It works with both forked and spawned
+    workers.
+
+    :param log_queue: The multiprocessing queue passed to start_queue_logging.
+    :param level: An integer with the level of the worker's loggers.
+     Defaults to logging.INFO.
+    """
+    global _queue_handler, _listener
+    # A forked worker has a copy of the main process's listener, but not its
+    # thread
+    _listener = None
+    _queue_handler = QueueHandler(log_queue)
+    for l in _loggers.values():
+        _set_handlers(l, [_queue_handler])
         l.setLevel(level)
-    for nm, lgr in logging.Logger.manager.loggerDict.items():
-        if not isinstance(lgr, logging.PlaceHolder):
-            for h in lgr.handlers:
-                if "<stdout>" in repr(h):
-                    h.setLevel(level)